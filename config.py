@@ -1,3 +1,12 @@
 IB_HOST = "127.0.0.1"
 IB_PORT = 7497  # 7497 for paper trading, 7496 for live trading
 IB_CLIENT_ID = 2
+
+DATA_FOLDER = "data"
+ORDER_LOG_CSV = "logs/option_order_log.csv"
+
+# Order / connection timings (seconds)
+FILL_TIMEOUT = 5  # how long a limit order may rest before it is cancelled
+EXEC_POLL_INTERVAL = 1.0  # upper bound for a single wait on IB updates (e.g. cancel confirmation)
+RECONNECT_MAX_RETRIES = 5
+RECONNECT_RETRY_DELAY = 3  # first backoff step; doubles on each failed attempt
@@ -1,3 +1,5 @@
+import atexit
+import threading
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
@@ -13,12 +15,91 @@ client = gspread.authorize(creds)
 # Open Google Sheet
 sheet = client.open_by_key("1_ZtKjOOrcOkqsvyypGVzNlRoNwcn6LtwvXQPtOTea2Y").sheet1
 
+# Rows are buffered and written with one append_rows call per batch
+BATCH_SIZE = 20
+FLUSH_INTERVAL = 5  # seconds
+MAX_PENDING = 1024  # rows kept while the Sheets API is unavailable; newer rows are dropped beyond this
+MAX_BACKOFF = 60  # seconds between retries after repeated flush failures
+SHUTDOWN_TIMEOUT = 10  # seconds to let an in-flight batch finish at exit
+
+_pending = []
+_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+
+
+def flush():
+    """Write all pending rows to the Google Sheet in a single API call."""
+    with _lock:
+        batch = _pending[:]
+        _pending.clear()
+    if not batch:
+        return
+    try:
+        sheet.append_rows(batch, value_input_option="USER_ENTERED")
+    except Exception:
+        # Put the rows back so the next flush retries them
+        with _lock:
+            _pending[:0] = batch
+            dropped = len(_pending) - MAX_PENDING
+            if dropped > 0:
+                del _pending[MAX_PENDING:]
+        if dropped > 0:
+            print(f"Google Sheet backlog full, dropped {dropped} log entries")
+        raise
+    print(f"Log entries added: {len(batch)}")
+
+
+def _flush_worker():
+    delay = FLUSH_INTERVAL
+    while not _stop.is_set():
+        if delay > FLUSH_INTERVAL:
+            # Backing off after a failure: ignore early wake-ups from log_order, only shutdown cuts it short
+            _stop.wait(delay)
+        else:
+            _wake.wait(delay)
+        _wake.clear()
+        if _stop.is_set():
+            break
+        try:
+            flush()
+            delay = FLUSH_INTERVAL
+        except Exception as e:
+            delay = min(delay * 2, MAX_BACKOFF)
+            print(f"Failed to flush log entries to Google Sheet (retrying in {delay}s):", e)
+
+
+def _shutdown():
+    """Stop the flusher, let an in-flight batch finish, then write whatever is still pending."""
+    _stop.set()
+    _wake.set()
+    _worker.join(SHUTDOWN_TIMEOUT)
+    try:
+        flush()
+    except Exception as e:
+        print("Failed to flush log entries to Google Sheet at exit:", e)
+
+
+_worker = threading.Thread(target=_flush_worker, name="google-logger-flush", daemon=True)
+_worker.start()
+atexit.register(_shutdown)
+
+
 def log_order(ticker, expiry, strike, premium, orderStatus, clientId, permId, reasonCancelled=""):
-    """Append a log entry to Google Sheet."""
+    """Queue a log entry for the Google Sheet (written by the background flusher)."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # current timestamp
     row = [timestamp, ticker, expiry, strike, premium, orderStatus, clientId, permId, reasonCancelled]
-    sheet.append_row(row, value_input_option="USER_ENTERED")
-    print("Log entry added:", row)
+    with _lock:
+        dropped = len(_pending) >= MAX_PENDING
+        if not dropped:
+            _pending.append(row)
+        full = len(_pending) >= BATCH_SIZE
+    if full:
+        _wake.set()
+    if dropped:
+        print("Google Sheet backlog full, dropping log entry:", row)
+    else:
+        print("Log entry queued:", row)
 
 
 # # Example usage:
@@ -7,27 +7,39 @@ from datetime import datetime
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# Re-wrap stdout once at import so emoji log lines don't fail on non-UTF-8 consoles
+if hasattr(sys.stdout, "buffer") and (getattr(sys.stdout, "encoding", None) or "").lower() != "utf-8":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-def setup_logger(name: str) -> logging.Logger:
-    log_file = os.path.join(LOG_DIR, f"{datetime.now().strftime('%Y-%m-%d')}.log")
+_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_handlers = []
 
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
 
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-    # Avoid adding handlers multiple times
-    if not logger.handlers:
+def _get_handlers():
+    """Create the shared file + console handlers on first use."""
+    if not _handlers:
+        log_file = os.path.join(LOG_DIR, f"{datetime.now().strftime('%Y-%m-%d')}.log")
 
         # File handler with UTF-8 encoding
         file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        file_handler.setFormatter(_formatter)
+        _handlers.append(file_handler)
 
-        # Console handler with UTF-8 encoding
-        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+        # Console handler on the (UTF-8) stdout
         console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        console_handler.setFormatter(_formatter)
+        _handlers.append(console_handler)
+    return _handlers
+
+
+def setup_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    # Avoid adding handlers multiple times
+    if not logger.handlers:
+        for handler in _get_handlers():
+            logger.addHandler(handler)
 
     return logger
@@ -1,39 +1,121 @@
+import asyncio
+import hashlib
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import os
+import time
 import config
-from ib_insync import IB, Stock, Option
-from src.ib_client import IBClient
+from ib_insync import IB, Stock, Option, util
+from src.ib_client import IBClient, get_ib_client, parse_yyyymmdd
 from logger import setup_logger
-from datetime import datetime, date
+from datetime import date
 import yfinance as yf
+from curl_cffi import requests as curl_requests
 
 
 logger = setup_logger("DataHandler")
 
+COMPACT_EVERY = 500  # appended bars kept as deltas before folding into the Parquet snapshot
+TAIL_CACHE_BARS = 1000  # most recent bars kept in memory per symbol
+ROW_GROUP_BARS = 1000  # small row groups let the tail be read without scanning the file
+IB_BATCH_SIZE = 50  # contracts per IB request
+IB_MAX_CONCURRENT = 4  # IB requests in flight at once, to stay under the API pacing limits
+
+CACHE_DIR = os.path.expanduser("~/.poe_cache")
+YF_CACHE_DIR = os.path.join(CACHE_DIR, "yf")
+PRICE_TTL = 60  # seconds; a 1-minute bar series is stale after a minute
+YF_BATCH_SIZE = 20  # symbols per yf.download request
+CHAIN_TTL = PRICE_TTL  # seconds; the cached chain carries live bid/ask/last/IV, not just strikes
+
+_SAKAMOTO = np.array([0, 3, 2, 5, 0, 3, 5, 1, 4, 6, 2, 4], dtype=np.int32)  # month offsets for day-of-week
+
+BAR_COLUMNS = {"date": "Date", "open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"}
+BAR_DTYPES = {"Open": "float64", "High": "float64", "Low": "float64", "Close": "float64", "Volume": "float64"}
+
+
+def bars_to_df(bars) -> pd.DataFrame:
+    """Convert IB BarData objects to the OHLCV frame used for storage."""
+    df = util.df(bars)
+    if df is None:  # util.df returns None for an empty bar list
+        return pd.DataFrame(columns=list(BAR_COLUMNS.values())).astype(BAR_DTYPES)
+    return df[list(BAR_COLUMNS)].rename(columns=BAR_COLUMNS).astype(BAR_DTYPES)
+
+
+def read_bars_csv(path: str) -> pd.DataFrame:
+    """Read a legacy bar CSV with the pyarrow engine and pre-declared column types."""
+    return pd.read_csv(path, engine="pyarrow", dtype=BAR_DTYPES, parse_dates=["Date"])
+
+
+def is_bars_csv(path: str) -> bool:
+    """True when the CSV header is exactly the stored OHLCV layout (i.e. a bar history file)."""
+    with open(path, newline="") as f:
+        header = f.readline().strip().split(",")
+    return header == list(BAR_COLUMNS.values())
+
+
+def write_bars_parquet(df: pd.DataFrame, path: str) -> None:
+    """Write a bar frame to Parquet in ROW_GROUP_BARS row groups, swapping it in atomically."""
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False,
+                  row_group_size=ROW_GROUP_BARS)
+    os.replace(tmp_path, path)  # a crash mid-write leaves the previous file intact
+
+
+# One pooled HTTP/2 session for every Yahoo call; yfinance only accepts curl_cffi sessions
+_yf_session = curl_requests.Session(impersonate="chrome")
+_yf_memo: dict = {}
+
+
+def _cached_frame(key_parts, ttl, fetch):
+    """
+    Return fetch() (a DataFrame), reusing an in-memory or on-disk Parquet copy
+    stored under YF_CACHE_DIR while it is younger than ttl seconds.
+    """
+    key = hashlib.sha1("|".join(map(str, key_parts)).encode()).hexdigest()
+    now = time.time()
+    hit = _yf_memo.get(key)
+    if hit and now - hit[0] < ttl:
+        return hit[1]
+
+    path = os.path.join(YF_CACHE_DIR, f"{key}.parquet")
+    if os.path.exists(path) and now - os.path.getmtime(path) < ttl:
+        df = pd.read_parquet(path, engine="pyarrow")
+        _yf_memo[key] = (os.path.getmtime(path), df)
+        return df
+
+    df = fetch()
+    if not df.empty:
+        os.makedirs(YF_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        df.to_parquet(tmp_path, engine="pyarrow")
+        os.replace(tmp_path, path)  # atomic swap so readers never see a partial file
+        _yf_memo[key] = (now, df)
+    return df
+
+
 def get_option_data(symbol, expiry, strike, right="P", qty=1):
     # Fetch option chain for the given expiry
     # expiry_dt = datetime.datetime.strptime(expiry, "%Y%m%d").strftime("%Y-%m-%d")
-    expiry = datetime.strptime(expiry, "%Y%m%d").date()
+    expiry = parse_yyyymmdd(expiry)
     expiry_formatted = expiry.strftime("%Y-%m-%d")
 
-    ticker = yf.Ticker(symbol)
-    opt_chain = ticker.option_chain(expiry_formatted)
-
     # Pick puts or calls
-    if right.upper() == "C":
-        options = opt_chain.calls
-    else:
-        options = opt_chain.puts
-
-    # Match the strike
-    option_row = options[options["strike"] == float(strike)]
-    if option_row.empty:
+    side = "calls" if right.upper() == "C" else "puts"
+    options = _cached_frame(("chain", symbol, expiry_formatted, side), CHAIN_TTL,
+                            lambda: getattr(yf.Ticker(symbol, session=_yf_session).option_chain(expiry_formatted), side))
+
+    # Match the strike (Yahoo returns the chain sorted by strike)
+    strikes = options["strike"].to_numpy()
+    i = int(np.searchsorted(strikes, float(strike)))
+    if i >= len(strikes) or strikes[i] != float(strike):
         return None  # Option not found
 
-    bid = option_row["bid"].values[0]
-    ask = option_row["ask"].values[0]
-    last = option_row["lastPrice"].values[0]
-    iv = option_row["impliedVolatility"].values[0]
+    option_row = options.iloc[i]
+    bid = option_row["bid"]
+    ask = option_row["ask"]
+    last = option_row["lastPrice"]
+    iv = option_row["impliedVolatility"]
 
     # Calculate mid safely
     mid = (bid + ask) / 2 if (bid and ask) else None
@@ -56,13 +138,37 @@ def get_option_data(symbol, expiry, strike, right="P", qty=1):
         "conId": None  # Yahoo doesn’t give conId, only IBKR has it
     }
 
+_price_memo: dict = {}
+
+
+def get_last_prices(symbols: list[str]) -> dict[str, float]:
+    """
+    Latest 1-minute close per symbol, downloaded YF_BATCH_SIZE symbols per request.
+    Prices are reused for PRICE_TTL seconds; symbols without data are left out.
+    """
+    now = time.time()
+    prices = {s: _price_memo[s][1] for s in symbols
+              if s in _price_memo and now - _price_memo[s][0] < PRICE_TTL}
+    missing = [s for s in symbols if s not in prices]
+
+    for i in range(0, len(missing), YF_BATCH_SIZE):
+        batch = missing[i:i + YF_BATCH_SIZE]
+        data = yf.download(batch, period="1d", interval="1m", group_by="ticker",
+                           threads=True, progress=False, session=_yf_session)  # intraday
+        tickers = set(data.columns.get_level_values(0)) if not data.empty else set()
+        for s in batch:
+            closes = data[s]["Close"].dropna() if s in tickers else None
+            if closes is not None and not closes.empty:
+                prices[s] = float(closes.iloc[-1])
+                _price_memo[s] = (now, prices[s])
+    return prices
+
+
 def get_last_price(symbol: str) -> float:
     try:
-        ticker = yf.Ticker(symbol)
-        data = ticker.history(period="1d", interval="1m")  # intraday
-        if not data.empty:
-            last_price = data['Close'].iloc[-1]
-            return float(last_price)
+        last_price = get_last_prices([symbol]).get(symbol)
+        if last_price is not None:
+            return last_price
         else:
             raise ValueError(f"No price data found for {symbol}")
     except Exception as e:
@@ -79,6 +185,9 @@ class DataHandler:
         :param ib_client: An instance of IBClient to handle API interactions.
         """
         self.ib_client: IBClient = ib_client
+        self._delta_counts: dict = {}
+        self._tail_cache: dict[str, pd.DataFrame] = {}
+        self._param_cache: dict[tuple, tuple] = {}
 
     # ---------- STOCK DATA ----------
     def one_time_historical_data_loading(self, symbol: str, end_date_time: str,
@@ -87,20 +196,20 @@ class DataHandler:
         data = self.ib_client.get_historical_data(
             symbol, end_date_time=end_date_time, duration=duration, bar_size=bar_size
         )
-        df = pd.DataFrame([[bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume] for bar in data],
-                          columns=["Date", "Open", "High", "Low", "Close", "Volume"])
+        df = bars_to_df(data)
         self.save_historical_data(symbol=symbol, data=df)
+        self._tail_cache[symbol] = df.tail(TAIL_CACHE_BARS).reset_index(drop=True)
         logger.info(f"✅ Loaded historical data for {symbol} with {len(df)} rows.")
 
     def fetch_option_historical_data(self, conId: int, symbol: str,
                                      end_date_time: str = "", duration: str = "1 D", bar_size: str = "5 mins"):
         """
         Fetch historical data for a given option contract by conId.
-        Saves CSV as {symbol}_OPT_{conId}.csv.
+        Saves Parquet as {symbol}_OPT_{conId}.parquet.
         """
         from ib_insync import Contract
         option_contract = Contract(conId=conId)
-        self.ib_client.ib.qualifyContracts(option_contract)
+        option_contract = self.ib_client.qualify(option_contract) or option_contract
 
         bars = self.ib_client.ib.reqHistoricalData(
             option_contract,
@@ -112,134 +221,293 @@ class DataHandler:
             formatDate=1
         )
 
-        df = pd.DataFrame([[bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume] for bar in bars],
-                          columns=["Date", "Open", "High", "Low", "Close", "Volume"])
+        df = bars_to_df(bars)
 
-        file_path = os.path.join(config.DATA_FOLDER, f"{symbol}_OPT_{conId}.csv")
-        df.to_csv(file_path, index=False)
+        file_path = os.path.join(config.DATA_FOLDER, f"{symbol}_OPT_{conId}.parquet")
+        write_bars_parquet(df, file_path)
         logger.info(f"💾 Saved option historical data for {symbol} (conId={conId}) with {len(df)} rows → {file_path}")
         return df
 
+    def migrate_csv_to_parquet(self) -> None:
+        """One-time conversion of legacy bar-history CSVs to Parquet (skips already migrated ones)."""
+        for name in os.listdir(config.DATA_FOLDER):
+            if not name.endswith(".csv"):
+                continue
+            csv_path = os.path.join(config.DATA_FOLDER, name)
+            parquet_path = csv_path[:-len(".csv")] + ".parquet"
+            if os.path.exists(parquet_path) or not is_bars_csv(csv_path):
+                continue
+            df = read_bars_csv(csv_path)
+            write_bars_parquet(df, parquet_path)
+            logger.info(f"💾 Migrated {name} → {os.path.basename(parquet_path)} ({len(df)} rows)")
+
     def load_historical_data(self, symbol: str) -> pd.DataFrame:
-        """Load stored historical data for a stock symbol."""
-        file_path = os.path.join(config.DATA_FOLDER, f"{symbol}.csv")
-        return pd.read_csv(file_path) if os.path.exists(file_path) else pd.DataFrame()
+        """
+        Load stored historical data (Parquet snapshot + appended bars) for a stock symbol.
+        Falls back to a not yet migrated {symbol}.csv when there is no snapshot.
+        """
+        file_path = os.path.join(config.DATA_FOLDER, f"{symbol}.parquet")
+        csv_path = os.path.join(config.DATA_FOLDER, f"{symbol}.csv")
+        delta_dir = os.path.join(config.DATA_FOLDER, f"{symbol}_delta")
+        frames = []
+        if os.path.exists(file_path):
+            frames.append(pd.read_parquet(file_path, engine="pyarrow"))
+        elif os.path.exists(csv_path):
+            frames.append(read_bars_csv(csv_path))
+        if os.path.isdir(delta_dir):
+            frames += [pd.read_parquet(os.path.join(delta_dir, f), engine="pyarrow")
+                       for f in sorted(os.listdir(delta_dir))]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def load_recent_historical_data(self, symbol: str, n: int = TAIL_CACHE_BARS) -> pd.DataFrame:
+        """Load the last n stored bars, reading only the trailing row groups of the snapshot."""
+        file_path = os.path.join(config.DATA_FOLDER, f"{symbol}.parquet")
+        csv_path = os.path.join(config.DATA_FOLDER, f"{symbol}.csv")
+        delta_dir = os.path.join(config.DATA_FOLDER, f"{symbol}_delta")
+        frames = []
+        if os.path.isdir(delta_dir):
+            frames = [pd.read_parquet(os.path.join(delta_dir, f), engine="pyarrow")
+                      for f in sorted(os.listdir(delta_dir))]
+        if os.path.exists(file_path):
+            pf = pq.ParquetFile(file_path)
+            groups, rows = [], sum(len(f) for f in frames)
+            for i in reversed(range(pf.num_row_groups)):
+                if rows >= n:
+                    break
+                groups.insert(0, i)
+                rows += pf.metadata.row_group(i).num_rows
+            if groups:
+                frames.insert(0, pf.read_row_groups(groups).to_pandas())
+        elif os.path.exists(csv_path):
+            frames.insert(0, read_bars_csv(csv_path))
+        return pd.concat(frames, ignore_index=True).tail(n).reset_index(drop=True) if frames else pd.DataFrame()
+
+    def save_historical_data(self, symbol: str, data: pd.DataFrame, export_csv: bool = False) -> None:
+        """
+        Save historical data DataFrame to Parquet.
+        :param export_csv: Also write {symbol}.csv next to it (debugging only).
+        """
+        write_bars_parquet(data, os.path.join(config.DATA_FOLDER, f"{symbol}.parquet"))
+        if export_csv:
+            data.to_csv(os.path.join(config.DATA_FOLDER, f"{symbol}.csv"), index=False)
+
+        # The snapshot now holds everything, so pending deltas are redundant
+        delta_dir = os.path.join(config.DATA_FOLDER, f"{symbol}_delta")
+        if os.path.isdir(delta_dir):
+            for f in os.listdir(delta_dir):
+                os.remove(os.path.join(delta_dir, f))
+        self._delta_counts[symbol] = 0
+
+    def append_bar(self, symbol: str, bar: pd.DataFrame) -> None:
+        """
+        Persist a single new bar without rewriting the whole history.
+        Each bar goes to its own small file in {symbol}_delta/; every COMPACT_EVERY
+        bars the deltas are folded back into {symbol}.parquet.
+        """
+        delta_dir = os.path.join(config.DATA_FOLDER, f"{symbol}_delta")
+        os.makedirs(delta_dir, exist_ok=True)
+        if symbol not in self._delta_counts:
+            self._delta_counts[symbol] = len(os.listdir(delta_dir))
+
+        bar.to_parquet(os.path.join(delta_dir, f"{time.time_ns()}.parquet"), engine="pyarrow", index=False)
+        self._delta_counts[symbol] += 1
 
-    def save_historical_data(self, symbol: str, data: pd.DataFrame) -> None:
-        """Save historical data DataFrame to CSV."""
-        file_path = os.path.join(config.DATA_FOLDER, f"{symbol}.csv")
-        data.to_csv(file_path, index=False)
+        if self._delta_counts[symbol] >= COMPACT_EVERY:
+            self.save_historical_data(symbol, self.load_historical_data(symbol))
+            logger.info(f"🗜️ Compacted {COMPACT_EVERY} appended bars into {symbol}.parquet")
 
     def update_historical_data(self, symbol: str, end_date_time: str = "") -> pd.DataFrame:
-        """Fetch new data and merge with old historical data."""
-        old_data = self.load_historical_data(symbol)
+        """
+        Fetch new data, persist the latest bar and merge it into the in-memory tail.
+        Returns (df_new, last TAIL_CACHE_BARS bars of history).
+        """
+        if symbol not in self._tail_cache:
+            self._tail_cache[symbol] = self.load_recent_historical_data(symbol)
+        old_data = self._tail_cache[symbol]
         new_data = self.ib_client.get_historical_data(symbol, end_date_time=end_date_time,
                                                       duration="30 S", bar_size="30 secs")
-        df_new = pd.DataFrame([[bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume] for bar in new_data],
-                              columns=["Date", "Open", "High", "Low", "Close", "Volume"])
+        df_new = bars_to_df(new_data)
         df_new["status"] = ["null"] * len(df_new)
         df_new_temp = df_new.tail(1).reset_index(drop=True)
 
-        df_combined = (pd.concat([old_data, df_new_temp])
-                       .drop_duplicates(subset=["Date"], keep="first")
-                       .reset_index(drop=True)) if not old_data.empty else df_new
+        # Cold start: nothing stored yet, write the full fetch once
+        if old_data.empty:
+            self.save_historical_data(symbol, df_new)
+            self._tail_cache[symbol] = df_new.tail(TAIL_CACHE_BARS).reset_index(drop=True)
+            return df_new, self._tail_cache[symbol]
+
+        if df_new_temp.empty or df_new_temp["Date"].iloc[0] <= old_data["Date"].iloc[-1]:
+            return df_new, old_data
 
-        return df_new, df_combined
+        self.append_bar(symbol, df_new_temp)
+        self._tail_cache[symbol] = (pd.concat([old_data, df_new_temp])
+                                    .tail(TAIL_CACHE_BARS)
+                                    .reset_index(drop=True))
+
+        return df_new, self._tail_cache[symbol]
 
     # ---------- OPTION HELPERS ----------
     def _pick_nearest_friday(self, expirations):
         """Return nearest Friday expiry (YYYYMMDD) or earliest expiry available."""
-        to_date = lambda s: datetime.strptime(s, "%Y%m%d").date()
-        today = date.today()
-        dts = [to_date(x) for x in expirations]
-        fridays = sorted([d for d in dts if d >= today and d.weekday() == 4])
-        return (fridays[0] if fridays else min(dts)).strftime("%Y%m%d")
+        # YYYYMMDD integers sort chronologically, so no date objects are needed
+        ymd = np.array([int(x) for x in expirations], dtype=np.int32)
+        y, m, d = ymd // 10000, ymd // 100 % 100, ymd % 100
+        # Sakamoto's day-of-week (0 = Sunday ... 5 = Friday), vectorized over the whole list
+        y = y - (m < 3)
+        dow = (y + y // 4 - y // 100 + y // 400 + _SAKAMOTO[m - 1] + d) % 7
+        today = int(date.today().strftime("%Y%m%d"))
+        fridays = ymd[(ymd >= today) & (dow == 5)]
+        return str(fridays.min() if fridays.size else ymd.min())
 
     def _mid(self, bid, ask):
         return (bid + ask) / 2.0 if bid and ask and bid > 0 and ask > 0 else None
 
+    def _isnum(self, x):
+        return str(x).replace('.', '', 1).isdigit()
+
     def _as_float(self, x):
         try:
             return float(x) if x is not None else None
         except Exception:
             return None
 
-    # ---------- CORE: SELECT CSP ----------
-    def fetch_aapl_options_and_select_csp(self, min_unique_strikes: int = 10):
-        """Fetch AAPL options chain and return best cash-secured put (CSP)."""
+    def _option_params(self, symbol: str):
+        """
+        Return (stock conId, expirations, strikes, tradingClass) for the symbol's option chain.
+        Cached per calendar day in memory and in CACHE_DIR/secdef_{symbol}.parquet for warm restarts.
+        """
+        key = (symbol, date.today())
+        if key in self._param_cache:
+            return self._param_cache[key]
+
+        path = os.path.join(CACHE_DIR, f"secdef_{symbol}.parquet")
+        if os.path.exists(path):
+            row = pd.read_parquet(path, engine="pyarrow").iloc[0]
+            if row["date"] == key[1].isoformat():
+                self._param_cache[key] = (int(row["conId"]), list(row["expirations"]),
+                                          list(row["strikes"]), row["tradingClass"])
+                return self._param_cache[key]
+
         ib = self.ib_client.ib
-    
-        stock = Stock("AAPL", "SMART", "USD")
-        ib.qualifyContracts(stock)
-        [stkTicker] = ib.reqTickers(stock)
+        stock = Stock(symbol, "SMART", "USD")
+        stock = self.ib_client.qualify(stock) or stock
+        params = ib.reqSecDefOptParams(stock.symbol, "", stock.secType, stock.conId)
+        p = next((x for x in params if x.tradingClass == symbol and x.exchange in ("SMART", "BOX", "CBOE", "ISE", "NASDAQOM")), params[0])
+        entry = (stock.conId, list(p.expirations), list(p.strikes), p.tradingClass)
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        pd.DataFrame([{"date": key[1].isoformat(), "conId": entry[0], "expirations": entry[1],
+                       "strikes": entry[2], "tradingClass": entry[3]}]).to_parquet(path, engine="pyarrow")
+        self._param_cache[key] = entry
+        return entry
 
-        # last = self._as_float(stkTicker.marketPrice()) or self._as_float(stkTicker.last)
-        # if last is None:
-        #     raise RuntimeError("❌ Could not get AAPL last price (check market data permissions).")
+    def _qualify_and_fetch_tickers(self, *groups):
+        """
+        Qualify and snapshot each group of contracts concurrently.
+        Groups are split into IB_BATCH_SIZE chunks and at most IB_MAX_CONCURRENT
+        requests are in flight at once, so round-trips overlap without breaking IB pacing.
+        """
+        ib = self.ib_client.ib
+        chunk = lambda g: [g[i:i + IB_BATCH_SIZE] for i in range(0, len(g), IB_BATCH_SIZE)]
+        # Contracts coming from the IBClient cache already carry a conId
+        to_qualify = [c for g in groups for c in chunk([x for x in g if not x.conId])]
+        chunks = [c for g in groups for c in chunk(g)]
+        # Key on the requested values; IB fills in conId, tradingClass, ... while qualifying
+        keys = [(self.ib_client.contract_key(x), x) for c in to_qualify for x in c]
+
+        async def _run():
+            sem = asyncio.Semaphore(IB_MAX_CONCURRENT)
+
+            async def _limited(request, contracts):
+                async with sem:
+                    return await request(*contracts)
+
+            await asyncio.gather(*(_limited(ib.qualifyContractsAsync, c) for c in to_qualify))
+            results = await asyncio.gather(*(_limited(ib.reqTickersAsync, c) for c in chunks))
+            return [t for r in results for t in r]
+
+        tickers = ib.run(_run())
+        for key, contract in keys:
+            self.ib_client.cache_qualified(key, contract)
+        return tickers
+
+    def _option(self, expiry: str, strike: float, right: str):
+        """Return the qualified AAPL option from the IBClient cache, or a fresh unqualified one."""
+        option = Option("AAPL", expiry, strike, right, "SMART", currency="USD")
+        return self.ib_client.cached_contract(option) or option
+
+    # ---------- CORE: SELECT CSP ----------
+    def fetch_aapl_options_and_select_csp(self, min_unique_strikes: int = 10, confirm_with_yahoo: bool = False):
+        """
+        Fetch AAPL options chain and return best cash-secured put (CSP).
+        :param confirm_with_yahoo: Fall back to Yahoo's quote when IB returned no usable bid/ask.
+        """
         last = get_last_price("AAPL")
         last = 230.47
         # print("last price from  yahoo",last)
-        params = ib.reqSecDefOptParams(stock.symbol, "", stock.secType, stock.conId)
-        p = next((x for x in params if x.tradingClass == "AAPL" and x.exchange in ("SMART", "BOX", "CBOE", "ISE", "NASDAQOM")), params[0])
-        expiry = self._pick_nearest_friday(p.expirations)
+        _, expirations, chain_strikes, _ = self._option_params("AAPL")
+        expiry = self._pick_nearest_friday(expirations)
 
-        strikes_sorted = sorted([float(s) for s in p.strikes if str(s).replace('.', '', 1).isdigit()])
-        if not strikes_sorted:
+        strikes_arr = np.fromiter((float(s) for s in chain_strikes if self._isnum(s)), dtype=np.float64)
+        if not strikes_arr.size:
             raise RuntimeError("❌ No strikes returned by IB for AAPL.")
+        strikes_arr.sort()
 
-        atm_idx = min(range(len(strikes_sorted)), key=lambda i: abs(strikes_sorted[i] - last))
+        # Nearest strike: the insertion point or its left neighbour (ties go to the lower strike)
+        n = len(strikes_arr)
+        atm_idx = int(np.searchsorted(strikes_arr, last))
+        if atm_idx == n or (atm_idx > 0 and last - strikes_arr[atm_idx - 1] <= strikes_arr[atm_idx] - last):
+            atm_idx -= 1
         half = max(1, min_unique_strikes // 2)
-        lo, hi = max(0, atm_idx - half), min(len(strikes_sorted), atm_idx + half + 1)
-        sel = strikes_sorted[lo:hi]
-
-        while len(sel) < min_unique_strikes:
-            if lo > 0: sel.insert(0, strikes_sorted[lo-1]); lo -= 1
-            if hi < len(strikes_sorted): sel.append(strikes_sorted[hi]); hi += 1
-
-        contracts = [Option("AAPL", expiry, float(k), right, "SMART", currency="USD")
-                     for k in sel for right in ("C", "P")]
-        ib.qualifyContracts(*contracts)
-        tickers = ib.reqTickers(*contracts)
-
-        best_csp = None
-        for t in tickers:
-            k, right = t.contract.strike, t.contract.right
-            bid, ask = self._as_float(t.bid), self._as_float(t.ask)
-            iv = getattr(t.modelGreeks, "impliedVol", None) if getattr(t, "modelGreeks", None) else getattr(t, "impliedVolatility", None)
-            if right == "P" and k < last:
-                dist = last - k
-                if best_csp is None or dist < best_csp[0]:
-                    best_csp = (dist, k, t, bid, ask, iv)
-
-        if not best_csp:
+        lo, hi = max(0, atm_idx - half), min(n, atm_idx + half + 1)
+        if hi - lo < min_unique_strikes:
+            lo = max(0, atm_idx - min_unique_strikes // 2)
+            hi = min(n, lo + min_unique_strikes)
+            lo = max(0, hi - min_unique_strikes)
+        sel = strikes_arr[lo:hi]
+
+        calls = [self._option(expiry, float(k), "C") for k in sel]
+        puts = [self._option(expiry, float(k), "P") for k in sel]
+        tickers = self._qualify_and_fetch_tickers(calls, puts)
+
+        strikes = np.array([t.contract.strike for t in tickers], dtype=np.float64)
+        rights = np.array([t.contract.right for t in tickers])
+        mask = (rights == "P") & (strikes < last)
+        if not mask.any():
             logger.warning("[CSP] No OTM put found.")
             return None
 
-        _, strike, tkr, bid, ask, iv = best_csp
+        candidates = np.flatnonzero(mask)
+        csp_idx = int(candidates[np.argmin(last - strikes[candidates])])
+        tkr = tickers[csp_idx]
+        strike = float(strikes[csp_idx])
+        bid, ask = self._as_float(tkr.bid), self._as_float(tkr.ask)
+        iv = getattr(tkr.modelGreeks, "impliedVol", None) if getattr(tkr, "modelGreeks", None) else getattr(tkr, "impliedVolatility", None)
         mid = self._mid(bid, ask)
         qty, cash_required = 1, strike * 100
 
         logger.info(f"✅ Selected CSP: AAPL {expiry} P {strike} @ {mid} (IV={iv})")
-        # return {
-        #     "symbol": "AAPL",
-        #     "expiry": expiry,
-        #     "right": "P",
-        #     "strike": strike,
-        #     "last": last,
-        #     "bid": bid,
-        #     "ask": ask,
-        #     "mid": mid,
-        #     "iv": iv,
-        #     "qty": qty,
-        #     "cash_required": cash_required,
-        #     "conId": tkr.contract.conId
-        # }
-
-        return get_option_data("AAPL",expiry,strike,"P",qty=1)
+
+        # IB already gave us bid/ask/iv; only go back to Yahoo when asked to and IB had no quote
+        if confirm_with_yahoo and mid is None:
+            return get_option_data("AAPL", expiry, strike, "P", qty=qty)
+
+        return {
+            "symbol": "AAPL",
+            "expiry": expiry,
+            "right": "P",
+            "strike": strike,
+            "last": last,
+            "bid": bid,
+            "ask": ask,
+            "mid": mid,
+            "iv": iv,
+            "qty": qty,
+            "cash_required": cash_required,
+            "conId": tkr.contract.conId
+        }
 
 
 if __name__ == "__main__":
-    ib_client = IBClient()
-    if not ib_client.ib.isConnected():
-        ib_client.connect()
+    ib_client = get_ib_client()
     logger.info("📡 Connected to IB.")
@@ -1,8 +1,11 @@
+import asyncio
 import csv
 import os
-import time
-from datetime import datetime, timedelta
-from ib_insync import Option, Order, IB
+import weakref
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from ib_insync import Contract, Option, Order, IB
 from logger import setup_logger
 import config
 from google_logger import log_order
@@ -11,21 +14,31 @@ from google_logger import log_order
 
 logger = setup_logger("TradeManager")
 
-ORDER_LOG_CSV = "logs/option_order_log.csv"
+ORDER_LOG_CSV = config.ORDER_LOG_CSV
+_IST = ZoneInfo("Asia/Kolkata")  # order log timestamps are kept in IST
+
+_WEEKEND_ROLL = (0, 0, 0, 0, 0, 1, 2)  # days to roll back, indexed by date.weekday()
+
+
+@lru_cache(maxsize=None)
+def parse_yyyymmdd(s: str) -> date:
+    """Parse an IB-style YYYYMMDD string (cached; the same expiries come up repeatedly)."""
+    if len(s) != 8 or not s.isdigit():
+        raise ValueError(f"Expected a YYYYMMDD date, got {s!r}")
+    return date(int(s[:4]), int(s[4:6]), int(s[6:8]))
 
 
 def _normalize_expiry(expiry_str: str) -> str:
     """
     Normalize expiry to IB's expected Friday date (YYYYMMDD).
     """
-    dt = datetime.strptime(expiry_str, "%Y%m%d")
-    # If it's Saturday, roll back 1 day
-    if dt.weekday() == 5:
-        dt -= timedelta(days=1)
-    # If it's Sunday, roll back 2 days
-    elif dt.weekday() == 6:
-        dt -= timedelta(days=2)
-    return dt.strftime("%Y%m%d")
+    dt = parse_yyyymmdd(expiry_str)
+    # Saturday rolls back 1 day, Sunday 2 days; weekdays are already valid
+    roll = _WEEKEND_ROLL[dt.weekday()]
+    if not roll:
+        return expiry_str
+    dt -= timedelta(days=roll)
+    return f"{dt.year:04d}{dt.month:02d}{dt.day:02d}"
 
 
 def _ensure_csv_header(path):
@@ -41,17 +54,83 @@ def _ensure_csv_header(path):
 class IBClient:
     def __init__(self):
         self.ib = IB()
+        self._qualified_cache: dict[tuple, Contract] = {}
+
+    @staticmethod
+    def contract_key(contract: Contract) -> tuple:
+        """Cache key for a contract as requested (taken before IB fills in the qualified fields)."""
+        return (contract.conId, contract.secType, contract.symbol, contract.exchange, contract.currency,
+                contract.right, contract.strike, contract.lastTradeDateOrContractMonth,
+                contract.tradingClass, contract.multiplier)
+
+    def cached_contract(self, contract: Contract):
+        """Return the qualified contract for an identical earlier request, or None."""
+        return self._qualified_cache.get(self.contract_key(contract))
+
+    def cache_qualified(self, key: tuple, qualified: Contract) -> None:
+        """Remember a contract qualified outside qualify() (e.g. in an async batch)."""
+        if qualified.conId:
+            self._qualified_cache[key] = qualified
+
+    def qualify(self, contract: Contract):
+        """
+        Qualify a contract, reusing the result for identical contracts on later calls.
+        Returns the qualified contract, or None if IB could not qualify it.
+        """
+        key = self.contract_key(contract)
+        qualified = self._qualified_cache.get(key)
+        if qualified is None:
+            result = self.ib.qualifyContracts(contract)
+            if not result:
+                return None
+            qualified = self._qualified_cache[key] = result[0]
+        return qualified
 
     def connect(self):
         if not self.ib.isConnected():
             self.ib.connect(config.IB_HOST, config.IB_PORT, clientId=config.IB_CLIENT_ID)
 
+    async def connect_async(self):
+        """Non-blocking connect, so several clients/reconnects can overlap on one loop."""
+        if not self.ib.isConnected():
+            await self.ib.connectAsync(config.IB_HOST, config.IB_PORT, clientId=config.IB_CLIENT_ID)
+
+
+_shared_client = None
+
+
+def get_ib_client() -> IBClient:
+    """Return the process-wide IBClient, connecting it on first use (reuses its IB session and loop)."""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = IBClient()
+    _shared_client.connect()
+    return _shared_client
+
 
 class TradeManager:
-    def __init__(self, ib_client):
+    def __init__(self, ib_client, poll_interval: float = None, fill_timeout: float = None):
+        """
+        :param poll_interval: Upper bound in seconds for a single wait on IB updates
+                              (e.g. confirming a cancel); waits return early on the event.
+                              Defaults to config.EXEC_POLL_INTERVAL.
+        :param fill_timeout: Default seconds an order may rest before it is cancelled.
+                             Defaults to config.FILL_TIMEOUT.
+        """
         self.ib_client = ib_client
         self.ib = ib_client.ib
+        self.poll_interval = config.EXEC_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.fill_timeout = config.FILL_TIMEOUT if fill_timeout is None else fill_timeout
         _ensure_csv_header(ORDER_LOG_CSV)
+        # Keep the order log open for the lifetime of the manager instead of reopening per order
+        self._log_fh = open(ORDER_LOG_CSV, "a", newline="")
+        self._log_writer = csv.writer(self._log_fh)
+        # Closes the file when the manager is collected or at exit, without keeping it alive
+        self._log_finalizer = weakref.finalize(self, self._log_fh.close)
+
+    def close(self):
+        """Flush and close the order log file."""
+        self._log_finalizer()
 
     def place_option_limit_and_wait_cancel(self,
                                            ticker: str,
@@ -60,7 +139,8 @@ class TradeManager:
                                            right: str = "P",
                                            quantity: int = 1,
                                            limit_price: float = None,
-                                           wait_seconds: int = 5) -> dict:
+                                           wait_seconds: int = None) -> dict:
+        wait_seconds = self.fill_timeout if wait_seconds is None else wait_seconds
         # Normalize expiry
         expiry_str = str(expiry).replace("-", "")
         expiry_str = _normalize_expiry(expiry_str)
@@ -77,10 +157,9 @@ class TradeManager:
 
         # Qualify contract
         try:
-            qualified_contracts = self.ib.qualifyContracts(contract)
-            if not qualified_contracts:
+            qualified_contract = self.ib_client.qualify(contract)
+            if qualified_contract is None:
                 raise Exception("No qualified contract returned")
-            qualified_contract = qualified_contracts[0]
         except Exception as e:
             raise Exception(f"Failed to qualify contract {ticker} {expiry_str} {strike} {right}: {e}")
 
@@ -96,48 +175,42 @@ class TradeManager:
 
         # Place order
         trade = self.ib.placeOrder(qualified_contract, order)
+        order, status = trade.order, trade.orderStatus
+        order_id = order.orderId
         clientId = getattr(self.ib.client, "clientId", config.IB_CLIENT_ID)
-        permId = getattr(trade.order, "permId", None)
 
         logger.info(
             f"Placed SELL LMT order: {ticker} {qualified_contract.lastTradeDateOrContractMonth} "
-            f"{strike} {right} qty={quantity} @ {order_price} (orderId={trade.order.orderId})"
+            f"{strike} {right} qty={quantity} @ {order_price} (orderId={order_id})"
         )
 
         # Wait for fill or cancel
-        start = time.time()
-        last_status = None
-        filled = False
-        while time.time() - start < wait_seconds:
-            self.ib.waitOnUpdate(timeout=1.0)
-            last_status = trade.orderStatus.status
-            if last_status and last_status.lower() == "filled":
-                filled = True
-                break
+        filled = self.ib.run(self._wait_until_done(trade, wait_seconds))
+        last_status = status.status
 
         reason_cancelled = ""
         if not filled and (last_status is None or last_status.lower() not in ["cancelled", "inactive"]):
             try:
-                self.ib.cancelOrder(trade.order)
-                logger.info(f"Cancelled orderId={trade.order.orderId} after {wait_seconds}s (not filled).")
+                self.ib.cancelOrder(order)
+                logger.info(f"Cancelled orderId={order_id} after {wait_seconds}s (not filled).")
                 reason_cancelled = "Cancelled by timeout"
-                self.ib.waitOnUpdate(timeout=1.0)
-                last_status = trade.orderStatus.status
+                self.ib.run(self._wait_until_done(trade, self.poll_interval))
+                last_status = status.status
             except Exception as e:
-                logger.error(f"Error cancelling order {trade.order.orderId}: {e}")
+                logger.error(f"Error cancelling order {order_id}: {e}")
                 reason_cancelled = f"Cancel error: {e}"
 
-        # Log to CSV + Google Sheet
-        timestamp = datetime.now().astimezone().isoformat()
+        # Log to CSV + Google Sheet (permId is assigned by IB after submission, so read it now)
+        permId = order.permId
+        timestamp = datetime.now(_IST).isoformat()
         status_for_log = last_status if last_status else "Unknown"
         expiry_logged = qualified_contract.lastTradeDateOrContractMonth
 
         row = [timestamp, ticker, expiry_logged, float(strike), order_price,
                status_for_log, clientId, permId, reason_cancelled]
         try:
-            with open(ORDER_LOG_CSV, "a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(row)
+            self._log_writer.writerow(row)
+            self._log_fh.flush()
         except Exception as e:
             logger.error(f"Failed to write order log row: {e}")
 
@@ -167,25 +240,67 @@ class TradeManager:
             "clientId": clientId,
             "permId": permId,
             "reasonCancelled": reason_cancelled,
-            "orderId": getattr(trade.order, "orderId", None),
+            "orderId": order_id,
             "filled": filled
         }
 
-    def reconnect_and_resync(self, max_retries: int = 5, retry_delay: int = 3):
-        tries = 0
-        while tries < max_retries:
+    async def _wait_until_done(self, trade, wait_seconds: float) -> bool:
+        """Wait for the trade to fill, cancel or go inactive (at most wait_seconds). Returns True if filled."""
+        done = asyncio.Event()
+
+        def on_status(t):
+            if t.orderStatus.status.lower() in ("filled", "cancelled", "inactive"):
+                done.set()
+
+        trade.filledEvent += on_status
+        trade.statusEvent += on_status
+        try:
+            if not trade.isDone():
+                await asyncio.wait_for(done.wait(), timeout=wait_seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            trade.filledEvent -= on_status
+            trade.statusEvent -= on_status
+        return trade.orderStatus.status.lower() == "filled"
+
+    def reconnect_and_resync(self, max_retries: int = None, retry_delay: int = None, timeout: float = None):
+        return self.ib.run(self.reconnect_and_resync_async(max_retries, retry_delay, timeout))
+
+    async def _reconnect(self, max_retries: int, retry_delay: int):
+        for tries in range(1, max_retries + 1):
             try:
-                if not self.ib.isConnected():
-                    self.ib.connect(config.IB_HOST, config.IB_PORT, clientId=config.IB_CLIENT_ID)
+                await self.ib_client.connect_async()
                 logger.info("Reconnected to IB")
-                break
+                return
             except Exception as e:
-                tries += 1
-                logger.warning(f"Reconnect attempt {tries}/{max_retries} failed: {e}. Retrying in {retry_delay}s")
-                time.sleep(retry_delay)
+                if tries == max_retries:
+                    logger.warning(f"Reconnect attempt {tries}/{max_retries} failed: {e}. All retries used up")
+                    return
+                delay = retry_delay * 2 ** (tries - 1)
+                logger.warning(f"Reconnect attempt {tries}/{max_retries} failed: {e}. Retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    async def reconnect_and_resync_async(self, max_retries: int = None, retry_delay: int = None, timeout: float = None):
+        """
+        Reconnect with exponential backoff (retry_delay * 2**n), then resync orders/positions.
+        max_retries / retry_delay default to config.RECONNECT_MAX_RETRIES / RECONNECT_RETRY_DELAY.
+        :param timeout: Overall limit in seconds for the reconnect phase (None = no limit).
+        """
+        max_retries = config.RECONNECT_MAX_RETRIES if max_retries is None else max_retries
+        retry_delay = config.RECONNECT_RETRY_DELAY if retry_delay is None else retry_delay
+        try:
+            await asyncio.wait_for(self._reconnect(max_retries, retry_delay), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Reconnect gave up after {timeout}s")
+
+        if not self.ib.isConnected():
+            logger.warning("Not connected to IB, skipping resync")
+            return None
 
         try:
-            open_orders = self.ib.reqOpenOrders()
+            # Both read ib_insync's event-maintained state; connecting already synced it from IB
+            open_orders = self.ib.openTrades()
             positions = self.ib.positions()
             logger.info(f"Resynced: {len(open_orders)} open orders, {len(positions)} positions")
             return {"openOrders": open_orders, "positions": positions}
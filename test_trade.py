@@ -1,13 +1,11 @@
-from src.ib_client import IBClient, TradeManager
+from src.ib_client import TradeManager, get_ib_client
 from datetime import datetime
 from ib_insync import IB, Option
 import config
 
 def main():
     # Connect to IB
-    ib_client = IBClient()
-    ib_client.connect()
-    ib = ib_client.ib
+    ib_client = get_ib_client()
 
     tm = TradeManager(ib_client)
 
@@ -27,11 +25,10 @@ def main():
     )
 
     # Qualify contract with IB
-    qualified_contracts = ib.qualifyContracts(contract)
+    qualified_contract = ib_client.qualify(contract)
   
-    if not qualified_contracts:
+    if qualified_contract is None:
         raise Exception("No qualified contract returned")
-    qualified_contract = qualified_contracts[0]
 
     print("✅ Qualified contract expiry:", qualified_contract.lastTradeDateOrContractMonth)
     print("✅ ConId:", qualified_contract.conId)